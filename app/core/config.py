@@ -1,5 +1,5 @@
 import os
-from typing import Optional
+from typing import Literal, Optional
 from pydantic_settings import BaseSettings
 from dotenv import load_dotenv
 
@@ -43,6 +43,24 @@ class Settings(BaseSettings):
     API_V1_STR: str = "/api/v1"
     PROJECT_NAME: str = "FlightRadar24 Service"
 
+    # FlightRadar24 API: лимит запросов, повторы и circuit breaker
+    FR24_RATE_PER_SECOND: float = 2.0
+    FR24_BURST: int = 5
+    FR24_MAX_RETRIES: int = 3
+    FR24_BACKOFF_BASE_SECONDS: float = 1.0
+    FR24_BREAKER_THRESHOLD: int = 5
+    FR24_BREAKER_COOLDOWN_SECONDS: float = 60.0
+
+    # Траектории: глубина истории в памяти
+    TRACK_HISTORY_HOURS: int = 24
+
+    # Правила наблюдения (JSON), загружаемые при старте, в т.ч. в режиме --headless
+    WATCHLIST_FILE: Optional[str] = None
+
+    # CPU-bound stages: "inline" (в event loop) или "process" (пул процессов)
+    CPU_EXECUTOR_MODE: Literal["inline", "process"] = "inline"
+    CPU_WORKERS: Optional[int] = None  # None = по числу ядер
+
     class Config:
         case_sensitive = True
         env_file = os.path.join(BASE_DIR, ".env")
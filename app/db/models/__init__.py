@@ -1,3 +1,3 @@
-from .flight import Flight, FlightStats
+from .flight import CurrentFlight, Flight, FlightStats
 
-__all__ = ["Flight", "FlightStats"]
\ No newline at end of file
+__all__ = ["CurrentFlight", "Flight", "FlightStats"]
\ No newline at end of file
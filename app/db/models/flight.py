@@ -24,11 +24,30 @@ class Flight(Base):
     timestamp = Column(DateTime, index=True)
 
 
+class CurrentFlight(Base):
+    """Последняя известная позиция воздушного судна (одна строка на icao24)"""
+    __tablename__ = "current_flights"
+
+    icao24 = Column(String(20), primary_key=True)
+    callsign = Column(String(20), index=True, nullable=False)
+    aircraft_code = Column(String(10))
+    airline = Column(String(100))
+    airline_code = Column(String(10))
+    airline_icao = Column(String(10))
+    latitude = Column(Float)
+    longitude = Column(Float)
+    altitude = Column(Integer)
+    speed = Column(Integer)
+    origin_airport = Column(String(10))
+    destination_airport = Column(String(10))
+    last_seen = Column(DateTime, index=True, nullable=False)
+
+
 class FlightStats(Base):
     __tablename__ = "flight_stats"
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    period = Column(String(20), nullable=False)  # 'hourly' или 'daily'
+    period = Column(String(20), nullable=False)  # 'hourly', 'daily' или 'snapshot'
     start_time = Column(DateTime, nullable=False)
     aircraft_model = Column(String(50))
     airline = Column(String(100))
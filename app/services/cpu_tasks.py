@@ -0,0 +1,120 @@
+import os
+import tempfile
+from collections import Counter
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+
+class FlightRecord(NamedTuple):
+    """Компактный снимок рейса, который можно передать в процесс-воркер"""
+    callsign: str
+    icao24: Optional[str]
+    aircraft_code: Optional[str]
+    airline_name: str
+    airline_code: str
+    airline_icao: str
+    latitude: float
+    longitude: float
+    altitude: int
+    speed: int
+    origin_iata: Optional[str]
+    destination_iata: Optional[str]
+    # (icao, name, country) из кэша аэропортов
+    origin: Optional[Tuple[str, str, str]]
+    destination: Optional[Tuple[str, str, str]]
+
+
+CSV_FIELDS = [
+    'timestamp',
+    'callsign',
+    'aircraft_code',
+    'airline_name',
+    'airline_code',
+    'airline_icao',
+    'altitude_ft',
+    'speed_knots',
+    'origin_icao',
+    'origin_name',
+    'origin_country',
+    'destination_icao',
+    'destination_name',
+    'destination_country',
+    'route_description'
+]
+
+
+def build_csv_rows(records: List[FlightRecord], timestamp: str) -> List[dict]:
+    """Формирует строки CSV для снимка рейсов"""
+    rows = []
+    for record in records:
+        origin = record.origin or ('', '', '')
+        dest = record.destination or ('', '', '')
+        rows.append({
+            'timestamp': timestamp,
+            'callsign': record.callsign,
+            'aircraft_code': record.aircraft_code or 'N/A',
+            'airline_name': record.airline_name,
+            'airline_code': record.airline_code,
+            'airline_icao': record.airline_icao,
+            'altitude_ft': record.altitude,
+            'speed_knots': record.speed,
+            'origin_icao': origin[0],
+            'origin_name': origin[1],
+            'origin_country': origin[2],
+            'destination_icao': dest[0],
+            'destination_name': dest[1],
+            'destination_country': dest[2],
+            'route_description': (
+                f"{origin[0] if record.origin else '?'} "
+                f"({origin[1] if record.origin else 'Unknown'}) → "
+                f"{dest[0] if record.destination else '?'} "
+                f"({dest[1] if record.destination else 'Unknown'})"
+            )
+        })
+    return rows
+
+
+def render_flight_map(records: List[FlightRecord], center: Tuple[float, float], map_path: str) -> str:
+    """Генерирует интерактивную карту рейсов и сохраняет ее в map_path"""
+    import folium
+
+    m = folium.Map(location=center, zoom_start=7)
+
+    for record in records:
+        if record.latitude is None or record.longitude is None:
+            continue
+        folium.Marker(
+            [record.latitude, record.longitude],
+            popup=(
+                f"✈ {record.callsign}<br>"
+                f"Модель: {record.aircraft_code or 'N/A'}<br>"
+                f"Авиакомпания: {record.airline_name}<br>"
+                f"Код: {record.airline_code}<br>"
+                f"Высота: {record.altitude} ft<br>"
+                f"Скорость: {record.speed} узлов<br>"
+                f"Маршрут: {record.origin_iata or '?'} → {record.destination_iata or '?'}"
+            ),
+            icon=folium.Icon(color="red", icon="plane")
+        ).add_to(m)
+
+    # Пишем во временный файл и атомарно подменяем, чтобы параллельная
+    # перерисовка (команда map во время сбора) не испортила файл
+    fd, tmp_path = tempfile.mkstemp(suffix='.html', dir=os.path.dirname(map_path) or '.')
+    os.close(fd)
+    try:
+        m.save(tmp_path)
+        os.replace(tmp_path, map_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return map_path
+
+
+def aggregate_snapshot(records: List[FlightRecord]) -> Dict[str, List[Tuple[str, int]]]:
+    """Считает количество рейсов по моделям и авиакомпаниям в снимке"""
+    models = Counter(record.aircraft_code or 'UNKNOWN' for record in records)
+    airlines = Counter(record.airline_name or 'UNKNOWN' for record in records)
+    return {
+        'aircraft': models.most_common(),
+        'airlines': airlines.most_common()
+    }
+
@@ -1,19 +1,43 @@
 import asyncio
 import csv
-import folium
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 from pathlib import Path
 from typing import Dict, Optional, List, Tuple
 from dataclasses import dataclass
 from FlightRadar24 import FlightRadar24API
-from sqlalchemy import select
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.config import settings
 from db.session import async_session
+from services.cpu_tasks import (
+    CSV_FIELDS,
+    FlightRecord,
+    aggregate_snapshot,
+    build_csv_rows,
+    render_flight_map,
+)
+from services.request_governor import RequestGovernor
+from services.tracks import TrackPoint, TrackStore
+from services.watchlist import Watchlist
 
 DATA_DIR = Path("app/data")
 DATA_DIR.mkdir(exist_ok=True)
 fr_api = FlightRadar24API()
+# 13 параметров на строку; asyncpg допускает не более 32767 параметров в запросе
+UPSERT_BATCH_SIZE = 1000
+fr_governor = RequestGovernor(
+    rate=settings.FR24_RATE_PER_SECOND,
+    burst=settings.FR24_BURST,
+    max_retries=settings.FR24_MAX_RETRIES,
+    backoff_base=settings.FR24_BACKOFF_BASE_SECONDS,
+    breaker_threshold=settings.FR24_BREAKER_THRESHOLD,
+    breaker_cooldown=settings.FR24_BREAKER_COOLDOWN_SECONDS
+)
 
 
 @dataclass
@@ -21,6 +45,7 @@ class SaveResult:
     db: str
     csv_path: str
     map_path: str
+    stats: Optional[dict] = None
 
 
 class FlightDataService:
@@ -29,11 +54,30 @@ class FlightDataService:
         self.airline_cache: Dict[str, dict] = {}  
         self.black_sea_coords = (43.0, 34.0)
         self.is_running = True
+        self.interval_minutes = 59
+        self._cpu_pool: Optional[ProcessPoolExecutor] = None
+        self.watchlist = Watchlist()
+        if settings.WATCHLIST_FILE:
+            self._load_watchlist(settings.WATCHLIST_FILE)
+        self.tracks = TrackStore(timedelta(hours=settings.TRACK_HISTORY_HOURS))
+        self.last_snapshot: List[FlightRecord] = []
+        # Сборы данных не должны пересекаться (периодический и первоначальный)
+        self._ingest_lock = asyncio.Lock()
+        # История траекторий загружается один раз, даже при параллельных запросах
+        self._tracks_lock = asyncio.Lock()
+
+    def _load_watchlist(self, path: str):
+        """Загружает правила наблюдения из файла"""
+        try:
+            rules = self.watchlist.load_rules(path)
+            print(f"Загружено {len(rules)} правил наблюдения")
+        except Exception as e:
+            print(f"Ошибка при загрузке правил наблюдения из {path}: {e}")
 
-    async def _init_airline_cache(self):
+    async def _init_airline_cache(self) -> bool:
         """Инициализирует кэш авиакомпаний из API"""
         try:
-            airlines = fr_api.get_airlines()
+            airlines = await fr_governor.call("airlines", fr_api.get_airlines)
             for airline in airlines:
                 icao = airline.get('ICAO', '').upper()
                 if icao:  
@@ -43,8 +87,10 @@ class FlightDataService:
                         'icao': icao
                     }
             print(f"Загружено {len(self.airline_cache)} авиакомпаний в кэш")
+            return True
         except Exception as e:
             print(f"Ошибка при загрузке списка авиакомпаний: {e}")
+            return False
 
     def _get_airline_info(self, flight_obj) -> dict:
         """Возвращает полную информацию об авиакомпании для рейса"""
@@ -75,7 +121,7 @@ class FlightDataService:
 
         if code not in self.airport_cache:
             try:
-                details = fr_api.get_airport(code=code)
+                details = await fr_governor.call(("airport", code), fr_api.get_airport, code=code)
                 self.airport_cache[code] = {
                     'name': getattr(details, 'name', f'Airport {code}'),
                     'icao': getattr(details, 'icao', code),
@@ -84,168 +130,334 @@ class FlightDataService:
                 }
             except Exception as e:
                 print(f"Ошибка получения данных аэропорта {code}: {e}")
-                self.airport_cache[code] = {
+                placeholder = {
                     'name': f'Airport {code}',
                     'icao': code,
                     'iata': code,
                     'country': 'Unknown'
                 }
+                # После временной ошибки аэропорт будет запрошен снова в следующий раз
+                if fr_governor.is_transient(e):
+                    return placeholder
+                self.airport_cache[code] = placeholder
         return self.airport_cache[code]
 
-    def _generate_flight_map(self, flights) -> Path:
-        """Генерирует интерактивную карту рейсов"""
-        m = folium.Map(location=self.black_sea_coords, zoom_start=7)
+    async def _build_snapshot(self, flights) -> List[FlightRecord]:
+        """Собирает компактный снимок рейсов с данными авиакомпаний и аэропортов"""
+        # Уникальные аэропорты запрашиваются параллельно, лимит скорости соблюдает fr_governor
+        # (результаты временных ошибок не кэшируются, поэтому берем их из словаря,
+        # а не запрашиваем заново для каждого рейса)
+        codes = list({
+            code
+            for flight in flights
+            for code in (
+                getattr(flight, 'origin_airport_iata', None),
+                getattr(flight, 'destination_airport_iata', None)
+            )
+            if code
+        })
+        airports = dict(zip(codes, await asyncio.gather(*(self.get_airport_details(code) for code in codes))))
 
+        records = []
         for flight in flights:
-            if hasattr(flight, 'latitude') and hasattr(flight, 'longitude'):
-                origin = getattr(flight, 'origin_airport_iata', '?')
-                dest = getattr(flight, 'destination_airport_iata', '?')
+            try:
                 airline_info = self._get_airline_info(flight)
-
-                folium.Marker(
-                    [flight.latitude, flight.longitude],
-                    popup=(
-                        f"✈ {flight.callsign}<br>"
-                        f"Модель: {getattr(flight, 'aircraft_code', 'N/A')}<br>"
-                        f"Авиакомпания: {airline_info['name']}<br>"
-                        f"Код: {airline_info['code']}<br>"
-                        f"Высота: {flight.altitude} ft<br>"
-                        f"Скорость: {flight.ground_speed} узлов<br>"
-                        f"Маршрут: {origin} → {dest}"
+                origin_iata = getattr(flight, 'origin_airport_iata', None)
+                dest_iata = getattr(flight, 'destination_airport_iata', None)
+                origin_details = airports.get(origin_iata)
+                dest_details = airports.get(dest_iata)
+
+                records.append(FlightRecord(
+                    callsign=flight.callsign,
+                    icao24=getattr(flight, 'icao_24bit', None),
+                    aircraft_code=getattr(flight, 'aircraft_code', None),
+                    airline_name=airline_info['name'],
+                    airline_code=airline_info['code'],
+                    airline_icao=airline_info['icao'],
+                    latitude=getattr(flight, 'latitude', None),
+                    longitude=getattr(flight, 'longitude', None),
+                    altitude=flight.altitude,
+                    speed=flight.ground_speed,
+                    origin_iata=origin_iata,
+                    destination_iata=dest_iata,
+                    origin=(
+                        (origin_details['icao'], origin_details['name'], origin_details['country'])
+                        if origin_details else None
                     ),
-                    icon=folium.Icon(color="red", icon="plane")
-                ).add_to(m)
+                    destination=(
+                        (dest_details['icao'], dest_details['name'], dest_details['country'])
+                        if dest_details else None
+                    )
+                ))
+            except Exception as e:
+                print(f"Ошибка обработки рейса {getattr(flight, 'callsign', 'UNKNOWN')}: {e}")
+        return records
 
+    def _get_cpu_pool(self) -> Optional[ProcessPoolExecutor]:
+        """Возвращает пул процессов, если включен режим process"""
+        if settings.CPU_EXECUTOR_MODE != "process":
+            return None
+        if self._cpu_pool is None:
+            # К этому моменту уже работают потоки (stdin, asyncio.to_thread),
+            # а fork многопоточного процесса может зависнуть
+            self._cpu_pool = ProcessPoolExecutor(
+                max_workers=settings.CPU_WORKERS,
+                mp_context=multiprocessing.get_context("forkserver")
+            )
+        return self._cpu_pool
+
+    async def _run_cpu(self, func, *args):
+        """Выполняет CPU-задачу в пуле процессов или прямо в текущем потоке"""
+        pool = self._get_cpu_pool()
+        if pool is None:
+            return func(*args)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(pool, func, *args)
+
+    def close(self):
+        """Останавливает пул процессов"""
+        if self._cpu_pool is not None:
+            self._cpu_pool.shutdown(cancel_futures=True)
+            self._cpu_pool = None
+
+    async def _generate_flight_map(self, records: List[FlightRecord]) -> Path:
+        """Генерирует интерактивную карту рейсов"""
         map_path = DATA_DIR / "black_sea_flights.html"
-        m.save(map_path)
+        await self._run_cpu(render_flight_map, records, self.black_sea_coords, str(map_path))
         return map_path
 
-    async def _save_to_db(self, session: AsyncSession, flights):
-        """Сохраняет рейсы в базу данных"""
-        from db.models.flight import Flight
-
-        for flight in flights:
-            airline_info = self._get_airline_info(flight)
+    async def _save_to_db(
+        self,
+        session: AsyncSession,
+        records: List[FlightRecord],
+        timestamp: datetime,
+        stats: Dict[str, List[Tuple[str, int]]]
+    ):
+        """Сохраняет рейсы и статистику снимка в базу данных"""
+        from db.models.flight import Flight, FlightStats
+
+        for record in records:
             db_flight = Flight(
-                callsign=flight.callsign,
-                icao24=getattr(flight, 'icao_24bit', None),
-                aircraft_code=getattr(flight, 'aircraft_code', 'UNKNOWN'),
-                airline=airline_info['name'],
-                airline_code=airline_info['code'],
-                airline_icao=airline_info['icao'],
-                latitude=flight.latitude,
-                longitude=flight.longitude,
-                altitude=flight.altitude,
-                speed=flight.ground_speed,
-                origin_airport=getattr(flight, 'origin_airport_iata', None),
-                destination_airport=getattr(flight, 'destination_airport_iata', None),
-                timestamp=datetime.now()
+                callsign=record.callsign,
+                icao24=record.icao24,
+                aircraft_code=record.aircraft_code or 'UNKNOWN',
+                airline=record.airline_name,
+                airline_code=record.airline_code,
+                airline_icao=record.airline_icao,
+                latitude=record.latitude,
+                longitude=record.longitude,
+                altitude=record.altitude,
+                speed=record.speed,
+                origin_airport=record.origin_iata,
+                destination_airport=record.destination_iata,
+                timestamp=timestamp
             )
             session.add(db_flight)
+
+        for model, count in stats['aircraft']:
+            session.add(FlightStats(
+                period='snapshot',
+                start_time=timestamp,
+                aircraft_model=model[:50],
+                flight_count=count
+            ))
+        for airline, count in stats['airlines']:
+            session.add(FlightStats(
+                period='snapshot',
+                start_time=timestamp,
+                airline=airline[:100],
+                flight_count=count
+            ))
+        await self._upsert_current_state(session, records, timestamp)
         await session.commit()
 
+    async def _upsert_current_state(self, session: AsyncSession, records: List[FlightRecord], timestamp: datetime):
+        """Обновляет таблицу текущих позиций и удаляет пропавшие воздушные суда"""
+        from db.models.flight import CurrentFlight
+
+        # ON CONFLICT не может обновить одну строку дважды в одном запросе
+        latest = {}
+        for record in records:
+            if record.icao24:
+                latest[record.icao24] = {
+                    'icao24': record.icao24,
+                    'callsign': record.callsign,
+                    'aircraft_code': record.aircraft_code or 'UNKNOWN',
+                    'airline': record.airline_name,
+                    'airline_code': record.airline_code,
+                    'airline_icao': record.airline_icao,
+                    'latitude': record.latitude,
+                    'longitude': record.longitude,
+                    'altitude': record.altitude,
+                    'speed': record.speed,
+                    'origin_airport': record.origin_iata,
+                    'destination_airport': record.destination_iata,
+                    'last_seen': timestamp
+                }
+
+        rows = list(latest.values())
+        for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+            stmt = pg_insert(CurrentFlight).values(rows[start:start + UPSERT_BATCH_SIZE])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[CurrentFlight.icao24],
+                set_={
+                    column: stmt.excluded[column]
+                    for column in rows[0]
+                    if column != 'icao24'
+                },
+                # более старый снимок не должен затирать свежую позицию
+                where=CurrentFlight.last_seen <= stmt.excluded.last_seen
+            )
+            await session.execute(stmt)
+
+        await self._expire_current_state(session, timestamp)
+
+    async def _expire_current_state(self, session: AsyncSession, timestamp: datetime):
+        """Удаляет суда, не попавшие в снимок от timestamp"""
+        from db.models.flight import CurrentFlight
+
+        # Снимок покрывает всю зону, поэтому не попавшие в него суда покинули ее
+        await session.execute(
+            delete(CurrentFlight).where(CurrentFlight.last_seen < timestamp)
+        )
+
+    def _current_state_since(self) -> datetime:
+        """Позиции старше одного цикла сбора (с запасом) считаются устаревшими"""
+        return datetime.now() - timedelta(minutes=self.interval_minutes + 5)
+
+    async def render_latest_map(self) -> Optional[Path]:
+        """Перерисовывает карту по последнему снимку без нового сбора данных"""
+        if not self.last_snapshot:
+            return None
+        return await self._generate_flight_map(self.last_snapshot)
+
     async def save_flight_data(self) -> Optional[SaveResult]:
         """Основной метод сбора и сохранения данных"""
+        async with self._ingest_lock:
+            return await self._collect()
+
+    async def _collect(self) -> Optional[SaveResult]:
         try:
             if not hasattr(self, 'airline_cache_loaded'):
-                await self._init_airline_cache()
-                self.airline_cache_loaded = True
+                if await self._init_airline_cache():
+                    self.airline_cache_loaded = True
 
             bounds = fr_api.get_bounds_by_point(*self.black_sea_coords, 300000)
-            flights = fr_api.get_flights(bounds=bounds)
+            try:
+                flights = await fr_governor.call(("flights", bounds), fr_api.get_flights, bounds=bounds)
+            except Exception as e:
+                print(f"❌ Не удалось получить список рейсов: {e}")
+                return None
 
             if not flights:
                 print("⚠️ Нет данных о рейсах в указанной зоне!")
+                async with async_session() as session:
+                    await self._expire_current_state(session, datetime.now())
+                    await session.commit()
                 return None
 
             timestamp = datetime.now()
+            records = await self._build_snapshot(flights)
+            print(f"Обработано {len(records)}/{len(flights)} рейсов")
+            self.last_snapshot = records
+            self.watchlist.evaluate(records, timestamp)
+
+            # Тяжелые по CPU этапы параллельно (в пуле процессов в режиме process);
+            # строки CSV строятся частями, чтобы большой снимок занял все ядра
+            workers = (settings.CPU_WORKERS or os.cpu_count() or 1) if self._get_cpu_pool() is not None else 1
+            chunk_size = max(1, -(-len(records) // workers))
+            *row_chunks, map_path, stats = await asyncio.gather(
+                *(
+                    self._run_cpu(build_csv_rows, records[start:start + chunk_size], timestamp.isoformat())
+                    for start in range(0, len(records), chunk_size)
+                ),
+                self._generate_flight_map(records),
+                self._run_cpu(aggregate_snapshot, records)
+            )
+            rows = [row for chunk in row_chunks for row in chunk]
+
             csv_path = DATA_DIR / f"flights_{timestamp.strftime('%Y%m%d')}.csv"
             file_exists = csv_path.exists()
 
             with open(csv_path, 'a', newline='', encoding='utf-8') as f:
-                writer = csv.DictWriter(f, fieldnames=[
-                    'timestamp',
-                    'callsign',
-                    'aircraft_code',
-                    'airline_name',
-                    'airline_code',
-                    'airline_icao',
-                    'altitude_ft',
-                    'speed_knots',
-                    'origin_icao',
-                    'origin_name',
-                    'origin_country',
-                    'destination_icao',
-                    'destination_name',
-                    'destination_country',
-                    'route_description'
-                ])
-
+                writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
                 if not file_exists:
                     writer.writeheader()
-
-                for i, flight in enumerate(flights, 1):
-                    try:
-                        # Получаем полную информацию об авиакомпании
-                        airline_info = self._get_airline_info(flight)
-
-                        # Получаем данные аэропортов
-                        origin_iata = getattr(flight, 'origin_airport_iata', None)
-                        dest_iata = getattr(flight, 'destination_airport_iata', None)
-                        origin_details = await self.get_airport_details(origin_iata) if origin_iata else None
-                        dest_details = await self.get_airport_details(dest_iata) if dest_iata else None
-
-                        # Формируем запись для CSV
-                        row_data = {
-                            'timestamp': timestamp.isoformat(),
-                            'callsign': flight.callsign,
-                            'aircraft_code': getattr(flight, 'aircraft_code', 'N/A'),
-                            'airline_name': airline_info['name'],
-                            'airline_code': airline_info['code'],
-                            'airline_icao': airline_info['icao'],
-                            'altitude_ft': flight.altitude,
-                            'speed_knots': flight.ground_speed,
-                            'origin_icao': origin_details['icao'] if origin_details else '',
-                            'origin_name': origin_details['name'] if origin_details else '',
-                            'origin_country': origin_details['country'] if origin_details else '',
-                            'destination_icao': dest_details['icao'] if dest_details else '',
-                            'destination_name': dest_details['name'] if dest_details else '',
-                            'destination_country': dest_details['country'] if dest_details else '',
-                            'route_description': (
-                                f"{origin_details['icao'] if origin_details else '?'} "
-                                f"({origin_details['name'] if origin_details else 'Unknown'}) → "
-                                f"{dest_details['icao'] if dest_details else '?'} "
-                                f"({dest_details['name'] if dest_details else 'Unknown'})"
-                            )
-                        }
-
-                        writer.writerow(row_data)
-
-                        if i % 50 == 0:
-                            print(f"Обработано {i}/{len(flights)} рейсов")
-
-                    except Exception as e:
-                        print(f"Ошибка обработки рейса {getattr(flight, 'callsign', 'UNKNOWN')}: {e}")
+                writer.writerows(rows)
 
             # Сохранение в базу данных
             async with async_session() as session:
-                await self._save_to_db(session, flights)
+                await self._save_to_db(session, records, timestamp, stats)
 
-            # Генерация карты
-            map_path = self._generate_flight_map(flights)
+            # Ошибка загрузки истории не отменяет уже сохраненный снимок;
+            # при следующем цикле история загрузится вместе с ним из БД
+            try:
+                await self._ensure_tracks_loaded()
+                self.tracks.add_snapshot(records, timestamp)
+            except Exception as e:
+                print(f"⚠️ Не удалось обновить траектории: {e}")
 
             return SaveResult(
                 db="PostgreSQL",
                 csv_path=str(csv_path),
-                map_path=str(map_path)
+                map_path=str(map_path),
+                stats=stats
             )
 
         except Exception as e:
             print(f"❌ Критическая ошибка при сохранении данных: {e}")
             return None
 
+    async def _ensure_tracks_loaded(self):
+        """Восстанавливает траектории из истории наблюдений (один раз)"""
+        if self.tracks.loaded:
+            return
+        async with self._tracks_lock:
+            if self.tracks.loaded:
+                return
+            try:
+                await self._load_tracks()
+            except Exception:
+                # частично загруженная история будет загружена заново
+                self.tracks.tracks.clear()
+                raise
+            self.tracks.loaded = True
+
+    async def _load_tracks(self):
+        from db.models.flight import Flight
+
+        since = datetime.now() - self.tracks.history
+        async with async_session() as session:
+            result = await session.stream(
+                select(
+                    Flight.icao24,
+                    Flight.callsign,
+                    Flight.timestamp,
+                    Flight.latitude,
+                    Flight.longitude,
+                    Flight.altitude
+                ).where(
+                    Flight.timestamp >= since,
+                    Flight.icao24.is_not(None),
+                    Flight.icao24 != '',
+                    Flight.latitude.is_not(None),
+                    Flight.longitude.is_not(None)
+                ).order_by(
+                    Flight.icao24,
+                    Flight.timestamp
+                )
+            )
+            async for icao24, callsign, timestamp, latitude, longitude, altitude in result:
+                self.tracks.add_point(icao24, callsign, TrackPoint(timestamp, latitude, longitude, altitude))
+
+    async def get_tracks(self, bbox: Tuple[float, float, float, float], zoom: int) -> Dict[str, dict]:
+        """Возвращает траектории в bbox (lat_min, lat_max, lon_min, lon_max), упрощенные под zoom"""
+        await self._ensure_tracks_loaded()
+        return self.tracks.query(bbox, zoom)
+
     async def run_periodically(self, interval_minutes=59):
         """Запускает периодический сбор данных"""
+        self.interval_minutes = interval_minutes
         while self.is_running:
             try:
                 result = await self.save_flight_data()
@@ -289,3 +501,29 @@ class FlightDataService:
                 )
             )
             return result.all()
+
+    async def get_current_position(self, icao24: str):
+        """Возвращает последнюю известную позицию воздушного судна"""
+        from db.models.flight import CurrentFlight
+
+        async with async_session() as session:
+            result = await session.execute(
+                select(CurrentFlight).where(
+                    CurrentFlight.icao24 == icao24,
+                    CurrentFlight.last_seen >= self._current_state_since()
+                )
+            )
+            return result.scalar_one_or_none()
+
+    async def get_airborne_now(self) -> List:
+        """Возвращает воздушные суда, находящиеся в воздухе в данный момент"""
+        from db.models.flight import CurrentFlight
+
+        async with async_session() as session:
+            result = await session.execute(
+                select(CurrentFlight).where(
+                    CurrentFlight.altitude > 0,
+                    CurrentFlight.last_seen >= self._current_state_since()
+                )
+            )
+            return result.scalars().all()
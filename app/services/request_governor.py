@@ -0,0 +1,181 @@
+import asyncio
+import random
+import time
+from typing import Any, Callable, Dict, Hashable, Optional
+
+import requests
+
+
+class CircuitOpenError(Exception):
+    """Запрос отклонен: circuit breaker открыт после серии ошибок"""
+
+
+class TokenBucket:
+    """Token bucket с адаптивной скоростью (AIMD)"""
+
+    def __init__(self, rate: float, burst: int, min_rate: float):
+        self.max_rate = rate
+        self.min_rate = min_rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        """Ожидает свободный токен"""
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def throttle(self):
+        """Сервер просит притормозить: скорость уменьшается вдвое"""
+        self._refill()
+        self.rate = max(self.min_rate, self.rate / 2)
+
+    def recover(self):
+        """Успешный запрос: скорость плавно возвращается к максимальной"""
+        self._refill()
+        self.rate = min(self.max_rate, self.rate + self.max_rate * 0.1)
+
+
+class CircuitBreaker:
+    """Размыкает цепь после threshold неудачных вызовов подряд на cooldown секунд"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.state = self.CLOSED
+        self.opened_at: Optional[float] = None
+        self.probe_in_flight = False
+
+    def check(self):
+        """Пропускает вызов или выбрасывает CircuitOpenError"""
+        if self.state == self.CLOSED:
+            return
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.cooldown:
+                raise CircuitOpenError("FR24 API временно недоступен")
+            self.state = self.HALF_OPEN
+        # half-open: пропускаем один пробный вызов, остальные ждут его результата
+        if self.probe_in_flight:
+            raise CircuitOpenError("FR24 API проверяется пробным запросом")
+        self.probe_in_flight = True
+
+    def record_success(self):
+        self.failures = 0
+        self.state = self.CLOSED
+        self.opened_at = None
+        self.probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+        self.probe_in_flight = False
+
+    def release(self):
+        """Пробный вызов отменен, не дав результата"""
+        self.probe_in_flight = False
+
+
+class RequestGovernor:
+    """Управляет вызовами синхронного API: лимит скорости, повторы,
+    circuit breaker и объединение одинаковых одновременных запросов"""
+
+    def __init__(
+        self,
+        rate: float,
+        burst: int,
+        max_retries: int,
+        backoff_base: float,
+        breaker_threshold: int,
+        breaker_cooldown: float,
+        min_rate: float = 0.05
+    ):
+        self.bucket = TokenBucket(rate, burst, min_rate)
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_cooldown)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+
+    @staticmethod
+    def is_throttled(exc: Exception) -> bool:
+        response = getattr(exc, 'response', None)
+        return getattr(response, 'status_code', None) == 429
+
+    @staticmethod
+    def is_transient(exc: Exception) -> bool:
+        """Ошибки, после которых имеет смысл повторить запрос"""
+        if isinstance(exc, CircuitOpenError):
+            return True
+        if isinstance(exc, (requests.ConnectionError, requests.Timeout)):
+            return True
+        response = getattr(exc, 'response', None)
+        status = getattr(response, 'status_code', None)
+        if status is not None:
+            return status == 429 or status >= 500
+        # CloudflareError библиотеки FlightRadar24 (ответ 520)
+        return type(exc).__name__ == 'CloudflareError'
+
+    async def call(self, key: Hashable, func: Callable, *args, **kwargs) -> Any:
+        """Выполняет func(*args, **kwargs) в потоке; одинаковые key объединяются"""
+        task = self._in_flight.get(key)
+        if task is None:
+            # Общая задача переживает отмену любого из ожидающих ее вызовов
+            task = asyncio.ensure_future(self._call_with_retry(func, *args, **kwargs))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Hashable, task: asyncio.Task):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if not task.cancelled():
+            # исключение получают ожидающие, не логируем его как необработанное
+            task.exception()
+
+    async def _call_with_retry(self, func: Callable, *args, **kwargs) -> Any:
+        self.breaker.check()
+        attempt = 0
+        try:
+            while True:
+                await self.bucket.acquire()
+                try:
+                    result = await asyncio.to_thread(func, *args, **kwargs)
+                except Exception as e:
+                    if not self.is_transient(e):
+                        # API ответил, значит доступен
+                        self.breaker.record_success()
+                        raise
+                    if self.is_throttled(e):
+                        self.bucket.throttle()
+                    if attempt >= self.max_retries:
+                        # одна ошибка breaker на логический вызов, а не на попытку
+                        self.breaker.record_failure()
+                        raise
+                    # full jitter: случайная пауза до base * 2^attempt
+                    await asyncio.sleep(random.uniform(0, self.backoff_base * 2 ** attempt))
+                    attempt += 1
+                else:
+                    self.breaker.record_success()
+                    self.bucket.recover()
+                    return result
+        except asyncio.CancelledError:
+            self.breaker.release()
+            raise
@@ -0,0 +1,189 @@
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from services.cpu_tasks import FlightRecord
+
+# Уровни масштаба, для которых хранятся упрощенные траектории
+ZOOM_LEVELS = (4, 6, 8, 10, 12)
+
+
+class TrackPoint(NamedTuple):
+    timestamp: datetime
+    latitude: float
+    longitude: float
+    altitude: Optional[int]
+
+
+def zoom_tolerance(zoom: int) -> float:
+    """Допуск упрощения в градусах: примерно один пиксель тайла 256px"""
+    return 360.0 / (256 * 2 ** zoom)
+
+
+def _segment_distance(p: TrackPoint, a: TrackPoint, b: TrackPoint) -> float:
+    dx = b.longitude - a.longitude
+    dy = b.latitude - a.latitude
+    if dx == 0 and dy == 0:
+        return ((p.longitude - a.longitude) ** 2 + (p.latitude - a.latitude) ** 2) ** 0.5
+    t = ((p.longitude - a.longitude) * dx + (p.latitude - a.latitude) * dy) / (dx * dx + dy * dy)
+    t = max(0.0, min(1.0, t))
+    return ((p.longitude - a.longitude - t * dx) ** 2 + (p.latitude - a.latitude - t * dy) ** 2) ** 0.5
+
+
+def douglas_peucker(points: List[TrackPoint], start: int, end: int, tolerance: float) -> List[int]:
+    """Возвращает индексы точек [start, end], оставшихся после упрощения"""
+    if end - start < 2:
+        return list(range(start, end + 1))
+
+    keep = [start, end]
+    stack = [(start, end)]
+    while stack:
+        first, last = stack.pop()
+        max_dist, index = 0.0, None
+        for i in range(first + 1, last):
+            dist = _segment_distance(points[i], points[first], points[last])
+            if dist > max_dist:
+                max_dist, index = dist, i
+        if index is not None and max_dist > tolerance:
+            keep.append(index)
+            stack.append((first, index))
+            stack.append((index, last))
+    return sorted(keep)
+
+
+class Track:
+    """Траектория одного воздушного судна с упрощенными версиями по уровням"""
+
+    def __init__(self, icao24: str, callsign: str):
+        self.icao24 = icao24
+        self.callsign = callsign
+        self.points: List[TrackPoint] = []
+        # индексы сохраненных точек для каждого уровня ZOOM_LEVELS
+        self.levels: Dict[int, List[int]] = {zoom: [] for zoom in ZOOM_LEVELS}
+        self.bbox: Optional[Tuple[float, float, float, float]] = None
+
+    def append(self, point: TrackPoint):
+        if self.points and point.timestamp <= self.points[-1].timestamp:
+            return
+        self.points.append(point)
+        if self.bbox is None:
+            self.bbox = (point.latitude, point.latitude, point.longitude, point.longitude)
+        else:
+            lat_min, lat_max, lon_min, lon_max = self.bbox
+            self.bbox = (
+                min(lat_min, point.latitude), max(lat_max, point.latitude),
+                min(lon_min, point.longitude), max(lon_max, point.longitude)
+            )
+
+        # Пересчитывается только хвост от предпоследней сохраненной точки
+        end = len(self.points) - 1
+        for zoom, kept in self.levels.items():
+            anchor = kept[-2] if len(kept) >= 2 else 0
+            del kept[bisect_right(kept, anchor) - 1:]
+            kept.extend(douglas_peucker(self.points, anchor, end, zoom_tolerance(zoom)))
+
+    def trim(self, since: datetime):
+        """Удаляет точки старше since, сдвигая индексы уровней"""
+        if not self.points or self.points[0].timestamp >= since:
+            return
+        dropped = bisect_left(self.points, since, key=lambda p: p.timestamp)
+        del self.points[:dropped]
+        if not self.points:
+            self.levels = {zoom: [] for zoom in ZOOM_LEVELS}
+            self.bbox = None
+            return
+
+        end = len(self.points) - 1
+        for zoom, kept in self.levels.items():
+            kept = [i - dropped for i in kept if i >= dropped]
+            # новая первая точка становится концом отрезка: пересчитываем только
+            # участок до первой сохраненной точки
+            head_end = kept[0] if kept else end
+            head = douglas_peucker(self.points, 0, head_end, zoom_tolerance(zoom))
+            self.levels[zoom] = head + kept[1:] if kept else head
+
+        self.bbox = (
+            min(p.latitude for p in self.points), max(p.latitude for p in self.points),
+            min(p.longitude for p in self.points), max(p.longitude for p in self.points)
+        )
+
+    def intersects(self, bbox: Tuple[float, float, float, float]) -> bool:
+        if self.bbox is None:
+            return False
+        lat_min, lat_max, lon_min, lon_max = bbox
+        t_lat_min, t_lat_max, t_lon_min, t_lon_max = self.bbox
+        return not (
+            t_lat_max < lat_min or t_lat_min > lat_max
+            or t_lon_max < lon_min or t_lon_min > lon_max
+        )
+
+    def query(self, bbox: Tuple[float, float, float, float], zoom: int) -> List[TrackPoint]:
+        """Точки уровня zoom внутри bbox (с соседями, чтобы линия не обрывалась)"""
+        level = max((z for z in ZOOM_LEVELS if z <= zoom), default=ZOOM_LEVELS[0])
+        if zoom > ZOOM_LEVELS[-1]:
+            indexes = range(len(self.points))
+        else:
+            indexes = self.levels[level]
+
+        lat_min, lat_max, lon_min, lon_max = bbox
+        candidates = [self.points[i] for i in indexes]
+        inside = [
+            lat_min <= p.latitude <= lat_max and lon_min <= p.longitude <= lon_max
+            for p in candidates
+        ]
+        return [
+            p for i, p in enumerate(candidates)
+            if inside[i]
+            or (i > 0 and inside[i - 1])
+            or (i + 1 < len(candidates) and inside[i + 1])
+        ]
+
+
+class TrackStore:
+    """Траектории всех наблюдаемых судов за окно history"""
+
+    def __init__(self, history: timedelta):
+        self.history = history
+        self.tracks: Dict[str, Track] = {}
+        self.loaded = False
+
+    def add_point(self, icao24: str, callsign: str, point: TrackPoint):
+        track = self.tracks.get(icao24)
+        if track is None:
+            track = self.tracks[icao24] = Track(icao24, callsign)
+        track.callsign = callsign
+        track.append(point)
+
+    def add_snapshot(self, records: List[FlightRecord], timestamp: datetime):
+        """Добавляет новые наблюдения и удаляет устаревшие траектории"""
+        for record in records:
+            if record.icao24 and record.latitude is not None and record.longitude is not None:
+                self.add_point(
+                    record.icao24,
+                    record.callsign,
+                    TrackPoint(timestamp, record.latitude, record.longitude, record.altitude)
+                )
+        self.expire(timestamp - self.history)
+
+    def expire(self, since: datetime):
+        for icao24, track in list(self.tracks.items()):
+            track.trim(since)
+            if not track.points:
+                del self.tracks[icao24]
+
+    def query(self, bbox: Tuple[float, float, float, float], zoom: int) -> Dict[str, dict]:
+        """Траектории, пересекающие bbox, упрощенные для уровня zoom"""
+        result = {}
+        for icao24, track in self.tracks.items():
+            if not track.intersects(bbox):
+                continue
+            points = track.query(bbox, zoom)
+            if points:
+                result[icao24] = {
+                    'callsign': track.callsign,
+                    'points': [
+                        (p.timestamp.isoformat(), p.latitude, p.longitude, p.altitude)
+                        for p in points
+                    ]
+                }
+        return result
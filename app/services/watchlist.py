@@ -0,0 +1,188 @@
+import itertools
+import json
+from collections import defaultdict
+from dataclasses import dataclass, fields
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from services.cpu_tasks import FlightRecord
+
+
+@dataclass(frozen=True)
+class WatchRule:
+    """Правило наблюдения; незаданные поля совпадают с любым значением"""
+    id: int
+    airline: Optional[str] = None  # ICAO авиакомпании, например THY
+    aircraft_type: Optional[str] = None  # код модели, например B738
+    callsign_prefix: Optional[str] = None
+    # (lat_min, lat_max, lon_min, lon_max)
+    geofence: Optional[Tuple[float, float, float, float]] = None
+    altitude_min: Optional[int] = None
+    altitude_max: Optional[int] = None
+
+    def matches_rest(self, record: FlightRecord) -> bool:
+        """Проверяет условия, которые не попадают в индекс"""
+        if self.geofence is not None:
+            if record.latitude is None or record.longitude is None:
+                return False
+            lat_min, lat_max, lon_min, lon_max = self.geofence
+            if not (lat_min <= record.latitude <= lat_max and lon_min <= record.longitude <= lon_max):
+                return False
+        if self.altitude_min is not None and (record.altitude or 0) < self.altitude_min:
+            return False
+        if self.altitude_max is not None and (record.altitude or 0) > self.altitude_max:
+            return False
+        return True
+
+
+@dataclass
+class WatchEvent:
+    rule: WatchRule
+    record: FlightRecord
+    timestamp: datetime
+
+
+class _PrefixBucket:
+    """Правила с одинаковыми ключами равенства, сгруппированные по префиксу позывного"""
+
+    def __init__(self):
+        self.by_prefix: Dict[str, List[WatchRule]] = defaultdict(list)
+        self.lengths: Set[int] = set()
+
+    def add(self, rule: WatchRule):
+        prefix = rule.callsign_prefix or ''
+        self.by_prefix[prefix].append(rule)
+        self.lengths.add(len(prefix))
+
+    def remove(self, rule: WatchRule):
+        prefix = rule.callsign_prefix or ''
+        self.by_prefix[prefix].remove(rule)
+        if not self.by_prefix[prefix]:
+            del self.by_prefix[prefix]
+            self.lengths = {len(p) for p in self.by_prefix}
+
+    def candidates(self, callsign: str):
+        for length in self.lengths:
+            # иначе короткий позывной попадет в одну корзину несколько раз
+            if length <= len(callsign):
+                yield from self.by_prefix.get(callsign[:length], ())
+
+
+class Watchlist:
+    """Набор правил, проверяемых за один проход по снимку рейсов.
+
+    Событие отправляется, когда судно начинает совпадать с правилом;
+    пока совпадение сохраняется в следующих снимках, оно не повторяется.
+    """
+
+    def __init__(self):
+        self.rules: Dict[int, WatchRule] = {}
+        self._index: Dict[Tuple[Optional[str], Optional[str]], _PrefixBucket] = {}
+        self._ids = itertools.count(1)
+        self._subscribers: List[Callable[[WatchEvent], None]] = []
+        # (id правила, судно), совпавшие в предыдущем снимке
+        self._active: Set[Tuple[int, str]] = set()
+
+    @staticmethod
+    def _normalize(predicates: dict) -> dict:
+        """Проверяет и приводит условия правила; ошибки выбрасываются как ValueError"""
+        allowed = {f.name for f in fields(WatchRule)} - {'id'}
+        unknown = set(predicates) - allowed
+        if unknown:
+            raise ValueError(f"неизвестные поля правила: {', '.join(sorted(unknown))}")
+
+        result = dict(predicates)
+        for key in ('airline', 'aircraft_type', 'callsign_prefix'):
+            value = result.get(key)
+            if value is None:
+                continue
+            if not isinstance(value, str) or not value.strip():
+                # пустой ключ равенства не совпал бы ни с одним рейсом
+                raise ValueError(f"пустое значение поля {key}")
+            result[key] = value.strip().upper()
+        if result.get('geofence') is not None:
+            geofence = tuple(float(v) for v in result['geofence'])
+            if len(geofence) != 4:
+                raise ValueError("geofence: ожидается (lat_min, lat_max, lon_min, lon_max)")
+            result['geofence'] = geofence
+        for key in ('altitude_min', 'altitude_max'):
+            if result.get(key) is not None:
+                result[key] = int(result[key])
+        return result
+
+    def add_rule(self, **predicates) -> WatchRule:
+        """Регистрирует правило и возвращает его (с присвоенным id)"""
+        rule = WatchRule(id=next(self._ids), **self._normalize(predicates))
+        self.rules[rule.id] = rule
+        key = (rule.airline, rule.aircraft_type)
+        self._index.setdefault(key, _PrefixBucket()).add(rule)
+        return rule
+
+    def load_rules(self, path: str) -> List[WatchRule]:
+        """Загружает правила из JSON-файла: список объектов с полями WatchRule без id"""
+        with open(path, encoding='utf-8') as f:
+            items = json.load(f)
+        if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+            raise ValueError("файл правил должен содержать список объектов")
+        # Сначала проверяем все правила, чтобы ошибка не оставила часть из них
+        normalized = []
+        for i, item in enumerate(items, 1):
+            try:
+                normalized.append(self._normalize(item))
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"правило {i}: {e}") from e
+        return [self.add_rule(**item) for item in normalized]
+
+    def remove_rule(self, rule_id: int) -> bool:
+        rule = self.rules.pop(rule_id, None)
+        if rule is None:
+            return False
+        self._active = {pair for pair in self._active if pair[0] != rule_id}
+        key = (rule.airline, rule.aircraft_type)
+        bucket = self._index[key]
+        bucket.remove(rule)
+        if not bucket.by_prefix:
+            del self._index[key]
+        return True
+
+    def subscribe(self, callback: Callable[[WatchEvent], None]):
+        """Добавляет обработчик событий совпадения"""
+        self._subscribers.append(callback)
+
+    def evaluate(self, records: List[FlightRecord], timestamp: datetime) -> List[WatchEvent]:
+        """Находит новые совпадения правил для снимка и рассылает события подписчикам"""
+        events = []
+        if not self._index:
+            self._active.clear()
+            return events
+
+        active = set()
+        for record in records:
+            airline = (record.airline_icao or '').upper() or None
+            aircraft_type = (record.aircraft_code or '').upper() or None
+            callsign = (record.callsign or '').upper()
+            # правило с незаданным ключом лежит в корзине с None на его месте
+            for key in {
+                (airline, aircraft_type),
+                (airline, None),
+                (None, aircraft_type),
+                (None, None)
+            }:
+                bucket = self._index.get(key)
+                if bucket is None:
+                    continue
+                for rule in bucket.candidates(callsign):
+                    if rule.matches_rest(record):
+                        pair = (rule.id, record.icao24 or callsign)
+                        if pair not in active and pair not in self._active:
+                            events.append(WatchEvent(rule=rule, record=record, timestamp=timestamp))
+                        active.add(pair)
+        self._active = active
+
+        for event in events:
+            for callback in self._subscribers:
+                try:
+                    callback(event)
+                except Exception as e:
+                    print(f"Ошибка обработчика правила #{event.rule.id}: {e}")
+        return events
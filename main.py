@@ -1,13 +1,251 @@
+import argparse
 import asyncio
+import signal
+import sys
+import threading
+from typing import AsyncIterator, Iterable, Set
+
 from app.services.flightradar_services import FlightDataService
 
+PROMPT = "\nВведите команду (hour/day/now/where/watch/unwatch/watches/track/map/exit): "
+STREAM_CHUNK = 20
+
+
+def _stdin_reader(loop: asyncio.AbstractEventLoop, queue: asyncio.Queue):
+    """Читает stdin в отдельном потоке и передает строки в очередь event loop"""
+    for line in sys.stdin:
+        loop.call_soon_threadsafe(queue.put_nowait, line)
+    loop.call_soon_threadsafe(queue.put_nowait, None)
+
+
+async def read_commands() -> AsyncIterator[str]:
+    """Асинхронно читает команды из консоли, не блокируя event loop"""
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    # daemon-поток не мешает завершению процесса, пока висит на чтении stdin
+    threading.Thread(target=_stdin_reader, args=(loop, queue), daemon=True).start()
+
+    while True:
+        line = await queue.get()
+        if line is None:
+            return
+        command = line.strip()
+        if command:
+            yield command
+        else:
+            print(PROMPT, end="", flush=True)
+
+
+async def stream_lines(lines: Iterable[str], chunk: int = STREAM_CHUNK):
+    """Печатает длинный вывод порциями, отдавая управление между ними"""
+    for i, line in enumerate(lines, 1):
+        print(line)
+        if i % chunk == 0:
+            await asyncio.sleep(0)
+
+
+async def cmd_hour(service: FlightDataService, limit: int = 20):
+    flights = await service.get_last_hour_flights()
+    print(f"\nРейсы за последний час ({len(flights)}):")
+    await stream_lines(
+        f"{i}. {flight.callsign} | "
+        f"{flight.aircraft_code if hasattr(flight, 'aircraft_code') else 'N/A'} | "
+        f"{flight.origin_airport or '?'}→{flight.destination_airport or '?'}"
+        for i, flight in enumerate(flights[:limit], 1)
+    )
+
+
+async def cmd_day(service: FlightDataService):
+    stats = await service.get_last_day_stats()
+    print("\n📊 Статистика за 24 часа:")
+    await stream_lines(
+        f"{i}. {model}: {count} рейсов"
+        for i, (model, count) in enumerate(stats[:10], 1)
+    )
+
+
+async def cmd_now(service: FlightDataService):
+    flights = await service.get_airborne_now()
+    print(f"\nСейчас в воздухе ({len(flights)}):")
+    await stream_lines(
+        f"{i}. {flight.callsign} | {flight.icao24} | {flight.aircraft_code} | "
+        f"{flight.altitude} ft | {flight.origin_airport or '?'}→{flight.destination_airport or '?'}"
+        for i, flight in enumerate(flights, 1)
+    )
+
+
+async def cmd_where(service: FlightDataService, icao24: str):
+    flight = await service.get_current_position(icao24) if icao24 else None
+    if flight is None:
+        print(f"\n⚠️ Воздушное судно {icao24 or '?'} сейчас не отслеживается")
+        return
+    print(
+        f"\n📍 {flight.callsign} ({flight.icao24}): "
+        f"{flight.latitude:.4f}, {flight.longitude:.4f} | "
+        f"{flight.altitude} ft | {flight.speed} узлов | "
+        f"обновлено {flight.last_seen:%H:%M:%S}"
+    )
+
+
+def parse_watch_rule(args: str) -> dict:
+    """Разбирает правило вида: airline=THY type=B738 callsign=THY alt=10000-40000 bbox=41,46,28,42"""
+    rule = {}
+    for pair in args.split():
+        key, _, value = pair.partition("=")
+        key = key.lower()
+        if key == "airline":
+            rule['airline'] = value
+        elif key == "type":
+            rule['aircraft_type'] = value
+        elif key == "callsign":
+            rule['callsign_prefix'] = value
+        elif key == "alt":
+            low, _, high = value.partition("-")
+            rule['altitude_min'] = int(low) if low else None
+            rule['altitude_max'] = int(high) if high else None
+        elif key == "bbox":
+            lat_min, lat_max, lon_min, lon_max = (float(v) for v in value.split(","))
+            rule['geofence'] = (lat_min, lat_max, lon_min, lon_max)
+        else:
+            raise ValueError(f"неизвестный параметр {key}")
+    if not rule:
+        raise ValueError("пустое правило")
+    return rule
+
+
+def print_watch_event(event):
+    record = event.record
+    print(
+        f"\n🔔 Правило #{event.rule.id}: {record.callsign} | {record.aircraft_code} | "
+        f"{record.airline_name} | {record.altitude} ft | "
+        f"{record.origin_iata or '?'}→{record.destination_iata or '?'}"
+    )
+
+
+async def cmd_watch(service: FlightDataService, args: str):
+    rule = service.watchlist.add_rule(**parse_watch_rule(args))
+    print(f"\n👁 Добавлено правило #{rule.id}")
+
+
+async def cmd_unwatch(service: FlightDataService, args: str):
+    if args.isdigit() and service.watchlist.remove_rule(int(args)):
+        print(f"\n🗑 Правило #{args} удалено")
+    else:
+        print(f"\n⚠️ Правило #{args or '?'} не найдено")
+
 
-async def main():
+async def cmd_watches(service: FlightDataService):
+    rules = list(service.watchlist.rules.values())
+    print(f"\nПравила наблюдения ({len(rules)}):")
+    await stream_lines(
+        f"#{rule.id}: " + ", ".join(
+            f"{name}={value}" for name, value in vars(rule).items()
+            if name != 'id' and value is not None
+        )
+        for rule in rules
+    )
+
+
+async def cmd_track(service: FlightDataService, args: str):
+    """track lat_min,lat_max,lon_min,lon_max zoom"""
+    bbox_arg, _, zoom_arg = args.partition(" ")
+    lat_min, lat_max, lon_min, lon_max = (float(v) for v in bbox_arg.split(","))
+    zoom = int(zoom_arg) if zoom_arg.strip() else 8
+    tracks = await service.get_tracks((lat_min, lat_max, lon_min, lon_max), zoom)
+    print(f"\nТраектории в области (zoom {zoom}): {len(tracks)}")
+    await stream_lines(
+        f"{icao24} {track['callsign']}: {len(track['points'])} точек, "
+        f"последняя {track['points'][-1][1]:.4f}, {track['points'][-1][2]:.4f}"
+        for icao24, track in tracks.items()
+    )
+
+
+async def cmd_map(service: FlightDataService):
+    print("\n🔄 Генерация карты по последнему снимку...")
+    map_path = await service.render_latest_map()
+    if map_path:
+        print(f"✔ Карта сохранена: {map_path}")
+    else:
+        print("❌ Нет данных для карты: снимок еще не собран")
+
+
+async def run_command(service: FlightDataService, command: str):
+    """Выполняет одну команду консоли; ошибки не влияют на остальные команды"""
+    name, _, arg = command.partition(" ")
+    name = name.lower()
+    try:
+        if name == "hour":
+            await cmd_hour(service, int(arg) if arg.isdigit() else 20)
+        elif name == "day":
+            await cmd_day(service)
+        elif name == "now":
+            await cmd_now(service)
+        elif name == "where":
+            await cmd_where(service, arg.strip().upper())
+        elif name == "watch":
+            await cmd_watch(service, arg.strip())
+        elif name == "unwatch":
+            await cmd_unwatch(service, arg.strip())
+        elif name == "watches":
+            await cmd_watches(service)
+        elif name == "track":
+            await cmd_track(service, arg.strip())
+        elif name == "map":
+            await cmd_map(service)
+        else:
+            print(
+                "\n⚠️ Доступные команды: hour [N], day, now, where <icao24>, "
+                "watch <правило>, unwatch <id>, watches, "
+                "track <lat_min,lat_max,lon_min,lon_max> [zoom], map, exit"
+            )
+    except Exception as e:
+        print(f"\n❌ Ошибка выполнения команды {name}: {e}")
+
+
+async def console(service: FlightDataService):
+    """Интерактивная консоль: каждая команда выполняется в отдельной задаче"""
+    commands: Set[asyncio.Task] = set()
+
+    def command_done(task: asyncio.Task):
+        commands.discard(task)
+        # приглашение печатается после вывода команды, а не сразу после ее запуска
+        if not task.cancelled():
+            print(PROMPT, end="", flush=True)
+
+    print(PROMPT, end="", flush=True)
+    try:
+        async for command in read_commands():
+            if command.lower() == "exit":
+                break
+            task = asyncio.create_task(run_command(service, command))
+            commands.add(task)
+            task.add_done_callback(command_done)
+    finally:
+        for task in commands:
+            task.cancel()
+        await asyncio.gather(*commands, return_exceptions=True)
+
+
+async def wait_for_shutdown():
+    """Ожидает SIGINT/SIGTERM в режиме без консоли"""
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass
+    await stop.wait()
+
+
+async def main(headless: bool = False):
     service = FlightDataService()
+    service.watchlist.subscribe(print_watch_event)
 
     print("\n🛫 Сервис мониторинга рейсов запущен")
     print("⏳ Первоначальный сбор данных...")
 
+    task = None
     try:
         # Первоначальный сбор данных
         result = await service.save_flight_data()
@@ -21,53 +259,35 @@ async def main():
         # Запуск периодического сбора
         task = asyncio.create_task(service.run_periodically())
 
-        while True:
-            command = input("\nВведите команду (hour/day/map/exit): ").strip().lower()
-
-            if command == "hour":
-                flights = await service.get_last_hour_flights()
-                print(f"\nРейсы за последний час ({len(flights)}):")
-                for i, flight in enumerate(flights[:20], 1):
-                    print(
-                        f"{i}. {flight.callsign} | "
-                        f"{flight.aircraft_code if hasattr(flight, 'aircraft_code') else 'N/A'} | "
-                        f"{flight.origin_airport or '?'}→{flight.destination_airport or '?'}"
-                    )
-
-            elif command == "day":
-                stats = await service.get_last_day_stats()
-                print("\n📊 Статистика за 24 часа:")
-                for i, (model, count) in enumerate(stats[:10], 1):
-                    print(f"{i}. {model}: {count} рейсов")
-
-            elif command == "map":
-                print("\n🔄 Генерация новой карты...")
-                result = await service.save_flight_data()
-                if result and hasattr(result, 'map_path'):
-                    print(f"✔ Карта сохранена: {result.map_path}")
-                elif result and isinstance(result, dict):
-                    print(f"✔ Карта сохранена: {result.get('map', 'неизвестно')}")
-                else:
-                    print("❌ Не удалось сгенерировать карту")
-
-            elif command == "exit":
-                task.cancel()
-                try:
-                    await task
-                except asyncio.CancelledError:
-                    pass
-                print("\n🛑 Сервис остановлен")
-                break
-
-            else:
-                print("\n⚠️ Доступные команды: hour, day, map, exit")
+        if headless:
+            await wait_for_shutdown()
+        else:
+            await console(service)
 
     except Exception as e:
         print(f"\n❌ Критическая ошибка: {str(e)}")
-        if 'task' in locals():
+
+    finally:
+        if task is not None:
+            service.is_running = False
             task.cancel()
-            await task
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        service.close()
+        print("\n🛑 Сервис остановлен")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Сервис мониторинга рейсов")
+    parser.add_argument(
+        "--headless",
+        action="store_true",
+        help="запуск без консоли (режим демона), остановка по SIGINT/SIGTERM"
+    )
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main(headless=parse_args().headless))
@@ -0,0 +1,194 @@
+import asyncio
+import threading
+
+import pytest
+import requests
+
+from services.request_governor import CircuitBreaker, CircuitOpenError, RequestGovernor
+
+
+def make_governor(**overrides):
+    params = dict(
+        rate=1000.0,
+        burst=100,
+        max_retries=2,
+        backoff_base=0.001,
+        breaker_threshold=3,
+        breaker_cooldown=60.0
+    )
+    params.update(overrides)
+    return RequestGovernor(**params)
+
+
+class HTTPStatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.response = type("Response", (), {"status_code": status_code})()
+
+
+@pytest.mark.asyncio
+async def test_identical_calls_are_coalesced():
+    governor = make_governor()
+    calls = 0
+    release = threading.Event()
+
+    def fetch():
+        nonlocal calls
+        calls += 1
+        release.wait(1)
+        return "LTAI"
+
+    tasks = [asyncio.create_task(governor.call(("airport", "AYT"), fetch)) for _ in range(5)]
+    await asyncio.sleep(0.05)
+    release.set()
+
+    assert await asyncio.gather(*tasks) == ["LTAI"] * 5
+    assert calls == 1
+    assert not governor._in_flight
+
+
+@pytest.mark.asyncio
+async def test_cancelled_leader_does_not_cancel_waiters():
+    governor = make_governor()
+    release = threading.Event()
+
+    def fetch():
+        release.wait(1)
+        return 42
+
+    leader = asyncio.create_task(governor.call("key", fetch))
+    await asyncio.sleep(0.01)
+    waiter = asyncio.create_task(governor.call("key", fetch))
+    await asyncio.sleep(0.01)
+
+    leader.cancel()
+    release.set()
+
+    assert await waiter == 42
+    with pytest.raises(asyncio.CancelledError):
+        await leader
+
+
+@pytest.mark.asyncio
+async def test_transient_errors_are_retried():
+    governor = make_governor()
+    attempts = 0
+
+    def flaky():
+        nonlocal attempts
+        attempts += 1
+        if attempts < 3:
+            raise requests.ConnectionError("reset")
+        return "ok"
+
+    assert await governor.call("flaky", flaky) == "ok"
+    assert attempts == 3
+    assert governor.breaker.failures == 0
+
+
+@pytest.mark.asyncio
+async def test_non_transient_error_is_not_retried():
+    governor = make_governor()
+    attempts = 0
+
+    def broken():
+        nonlocal attempts
+        attempts += 1
+        raise ValueError("bad code")
+
+    with pytest.raises(ValueError):
+        await governor.call("broken", broken)
+    assert attempts == 1
+
+
+@pytest.mark.asyncio
+async def test_throttle_halves_rate_and_success_recovers():
+    governor = make_governor(rate=10.0, max_retries=1)
+    attempts = 0
+
+    def limited():
+        nonlocal attempts
+        attempts += 1
+        if attempts == 1:
+            raise HTTPStatusError(429)
+        return "ok"
+
+    assert await governor.call("limited", limited) == "ok"
+    # 10 / 2 = 5, затем +10% от максимума после успеха
+    assert governor.bucket.rate == pytest.approx(6.0)
+
+
+@pytest.mark.asyncio
+async def test_breaker_counts_one_failure_per_logical_call():
+    governor = make_governor(max_retries=3, breaker_threshold=3)
+
+    def down():
+        raise requests.Timeout()
+
+    for _ in range(2):
+        with pytest.raises(requests.Timeout):
+            await governor.call("down", down)
+    assert governor.breaker.failures == 2
+    assert governor.breaker.state == CircuitBreaker.CLOSED
+
+    with pytest.raises(requests.Timeout):
+        await governor.call("down", down)
+    assert governor.breaker.state == CircuitBreaker.OPEN
+
+    with pytest.raises(CircuitOpenError):
+        await governor.call("down", down)
+
+
+def test_half_open_lets_single_probe_through():
+    breaker = CircuitBreaker(threshold=1, cooldown=0.0)
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    breaker.check()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.check()
+    breaker.check()
+
+
+def test_failed_probe_reopens_breaker():
+    breaker = CircuitBreaker(threshold=5, cooldown=0.0)
+    for _ in range(5):
+        breaker.record_failure()
+
+    breaker.check()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_after_cooldown_send_one_probe():
+    governor = make_governor(breaker_threshold=1, breaker_cooldown=0.0, max_retries=0)
+    calls = 0
+    release = threading.Event()
+
+    def down():
+        raise requests.Timeout()
+
+    with pytest.raises(requests.Timeout):
+        await governor.call("down", down)
+
+    def fetch():
+        nonlocal calls
+        calls += 1
+        release.wait(1)
+        return "ok"
+
+    tasks = [asyncio.create_task(governor.call(("airport", code), fetch)) for code in "ABCDE"]
+    await asyncio.sleep(0.05)
+    release.set()
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+
+    assert calls == 1
+    assert results.count("ok") == 1
+    assert sum(isinstance(r, CircuitOpenError) for r in results) == 4
+    assert governor.breaker.state == CircuitBreaker.CLOSED
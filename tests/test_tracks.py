@@ -0,0 +1,206 @@
+import math
+from datetime import datetime, timedelta
+
+import pytest
+
+from services.cpu_tasks import FlightRecord
+from services.tracks import (
+    ZOOM_LEVELS,
+    Track,
+    TrackPoint,
+    TrackStore,
+    _segment_distance,
+    douglas_peucker,
+    zoom_tolerance,
+)
+
+T0 = datetime(2025, 4, 9, 6, 0)
+
+
+def make_points(count, start=0):
+    """Извилистая траектория над Черным морем"""
+    return [
+        TrackPoint(
+            T0 + timedelta(minutes=i),
+            43.0 + 0.01 * i,
+            34.0 + 0.5 * math.sin(i / 20),
+            30000
+        )
+        for i in range(start, start + count)
+    ]
+
+
+def max_deviation(points, kept):
+    """Наибольшее отклонение исходных точек от упрощенной линии"""
+    worst = 0.0
+    for first, last in zip(kept, kept[1:]):
+        for i in range(first + 1, last):
+            worst = max(worst, _segment_distance(points[i], points[first], points[last]))
+    return worst
+
+
+def assert_level_valid(track, zoom):
+    kept = track.levels[zoom]
+    assert kept[0] == 0
+    assert kept[-1] == len(track.points) - 1
+    assert kept == sorted(set(kept))
+    assert max_deviation(track.points, kept) <= zoom_tolerance(zoom)
+
+
+def test_douglas_peucker_keeps_endpoints_and_corners():
+    points = [
+        TrackPoint(T0, 0.0, 0.0, None),
+        TrackPoint(T0, 0.0, 1.0, None),
+        TrackPoint(T0, 0.0, 2.0, None),
+        TrackPoint(T0, 1.0, 2.0, None),
+        TrackPoint(T0, 2.0, 2.0, None)
+    ]
+
+    assert douglas_peucker(points, 0, 4, 0.01) == [0, 2, 4]
+    assert douglas_peucker(points, 0, 4, 10.0) == [0, 4]
+    assert douglas_peucker(points, 1, 2, 0.01) == [1, 2]
+
+
+def test_douglas_peucker_respects_tolerance():
+    points = make_points(300)
+
+    for zoom in ZOOM_LEVELS:
+        kept = douglas_peucker(points, 0, len(points) - 1, zoom_tolerance(zoom))
+        assert max_deviation(points, kept) <= zoom_tolerance(zoom)
+
+
+def test_incremental_levels_match_full_simplification():
+    points = make_points(500)
+    track = Track('4BAA8C', 'THY1')
+    for point in points:
+        track.append(point)
+
+    for zoom in ZOOM_LEVELS:
+        assert_level_valid(track, zoom)
+        full = douglas_peucker(points, 0, len(points) - 1, zoom_tolerance(zoom))
+        # инкрементальное упрощение может оставить чуть больше точек
+        assert len(full) <= len(track.levels[zoom]) <= 2 * len(full)
+
+    # более мелкий масштаб оставляет не больше точек
+    sizes = [len(track.levels[zoom]) for zoom in ZOOM_LEVELS]
+    assert sizes == sorted(sizes)
+
+
+def test_out_of_order_points_are_ignored():
+    track = Track('4BAA8C', 'THY1')
+    first, second = make_points(2)
+    track.append(second)
+    track.append(first)
+
+    assert track.points == [second]
+
+
+def test_trim_drops_old_points_and_keeps_levels_valid():
+    points = make_points(300)
+    track = Track('4BAA8C', 'THY1')
+    for point in points:
+        track.append(point)
+
+    track.trim(T0 + timedelta(minutes=120))
+
+    assert track.points == points[120:]
+    for zoom in ZOOM_LEVELS:
+        assert_level_valid(track, zoom)
+    assert track.bbox == (
+        min(p.latitude for p in points[120:]), max(p.latitude for p in points[120:]),
+        min(p.longitude for p in points[120:]), max(p.longitude for p in points[120:])
+    )
+
+    # дальнейшие добавления продолжают работать после сдвига индексов
+    for point in make_points(50, start=300):
+        track.append(point)
+    for zoom in ZOOM_LEVELS:
+        assert_level_valid(track, zoom)
+
+
+def test_trim_everything_empties_track():
+    track = Track('4BAA8C', 'THY1')
+    for point in make_points(10):
+        track.append(point)
+
+    track.trim(T0 + timedelta(hours=1))
+
+    assert track.points == []
+    assert track.bbox is None
+    assert all(kept == [] for kept in track.levels.values())
+
+
+def make_record(icao24, latitude, longitude):
+    return FlightRecord(
+        callsign=f"CS{icao24}",
+        icao24=icao24,
+        aircraft_code='B738',
+        airline_name='Turkish Airlines',
+        airline_code='TK',
+        airline_icao='THY',
+        latitude=latitude,
+        longitude=longitude,
+        altitude=30000,
+        speed=450,
+        origin_iata=None,
+        destination_iata=None,
+        origin=None,
+        destination=None
+    )
+
+
+def test_store_expires_old_tracks_and_skips_records_without_position():
+    store = TrackStore(timedelta(hours=1))
+    store.add_snapshot([make_record('OLD', 43.0, 34.0)], T0)
+    store.add_snapshot(
+        [make_record('NEW', 43.0, 34.0), make_record('', 43.0, 34.0), make_record('NOPOS', None, None)],
+        T0 + timedelta(hours=2)
+    )
+
+    assert list(store.tracks) == ['NEW']
+
+
+@pytest.fixture
+def store():
+    store = TrackStore(timedelta(hours=24))
+    for point in make_points(500):
+        store.add_point('4BAA8C', 'THY1', point)
+    store.add_point('OTHER', 'PGT1', TrackPoint(T0, 50.0, 50.0, 30000))
+    return store
+
+
+def test_query_returns_only_tracks_in_bbox(store):
+    result = store.query((42.0, 49.0, 33.0, 35.0), 8)
+
+    assert list(result) == ['4BAA8C']
+    assert result['4BAA8C']['callsign'] == 'THY1'
+    assert store.query((0.0, 1.0, 0.0, 1.0), 8) == {}
+
+
+def test_query_selects_level_by_zoom(store):
+    bbox = (42.0, 49.0, 33.0, 35.0)
+    track = store.tracks['4BAA8C']
+
+    sizes = {zoom: len(store.query(bbox, zoom)['4BAA8C']['points']) for zoom in (2, 4, 9, 12, 15)}
+
+    # ниже минимального уровня используется самый грубый
+    assert sizes[2] == sizes[4] == len(track.levels[4])
+    # между уровнями берется ближайший меньший
+    assert sizes[9] == len(track.levels[8])
+    assert sizes[12] == len(track.levels[12])
+    # крупнее 12 отдаются исходные точки
+    assert sizes[15] == len(track.points)
+
+
+def test_query_includes_neighbours_outside_bbox(store):
+    track = store.tracks['4BAA8C']
+    # полоса, куда попадают только точки с индексами 200-209
+    bbox = (45.0, 45.095, 33.0, 35.0)
+
+    points = track.query(bbox, 15)
+
+    inside = [p for p in points if 45.0 <= p.latitude <= 45.095]
+    assert len(inside) == 10
+    assert points[0] == track.points[199]
+    assert points[-1] == track.points[210]
+    assert len(points) == 12
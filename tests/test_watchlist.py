@@ -0,0 +1,174 @@
+import json
+from datetime import datetime
+
+import pytest
+
+from services.cpu_tasks import FlightRecord
+from services.watchlist import Watchlist
+
+NOW = datetime(2025, 4, 9, 12, 0)
+
+
+def make_record(callsign, airline='THY', aircraft_code='B738', icao24=None,
+                latitude=43.0, longitude=34.0, altitude=30000):
+    return FlightRecord(
+        callsign=callsign,
+        icao24=icao24 or f"ICAO{callsign}",
+        aircraft_code=aircraft_code,
+        airline_name=airline,
+        airline_code='',
+        airline_icao=airline,
+        latitude=latitude,
+        longitude=longitude,
+        altitude=altitude,
+        speed=450,
+        origin_iata=None,
+        destination_iata=None,
+        origin=None,
+        destination=None
+    )
+
+
+def matched(watchlist, records):
+    return sorted((e.rule.id, e.record.callsign) for e in watchlist.evaluate(records, NOW))
+
+
+def test_rules_match_through_all_index_buckets():
+    watchlist = Watchlist()
+    both = watchlist.add_rule(airline='thy', aircraft_type='b738')
+    airline_only = watchlist.add_rule(airline='THY')
+    type_only = watchlist.add_rule(aircraft_type='A320')
+    wildcard = watchlist.add_rule(altitude_min=0)
+
+    records = [
+        make_record('THY1'),
+        make_record('THY2', aircraft_code='A320'),
+        make_record('PGT1', airline='PGT', aircraft_code='A320'),
+        make_record('AFL1', airline='AFL', aircraft_code='B738')
+    ]
+
+    assert matched(watchlist, records) == sorted([
+        (both.id, 'THY1'), (airline_only.id, 'THY1'), (wildcard.id, 'THY1'),
+        (airline_only.id, 'THY2'), (type_only.id, 'THY2'), (wildcard.id, 'THY2'),
+        (type_only.id, 'PGT1'), (wildcard.id, 'PGT1'),
+        (wildcard.id, 'AFL1')
+    ])
+
+
+def test_prefix_rules_fire_once_for_short_and_empty_callsigns():
+    watchlist = Watchlist()
+    short = watchlist.add_rule(callsign_prefix='TH')
+    watchlist.add_rule(callsign_prefix='THY1')
+    any_callsign = watchlist.add_rule()
+
+    assert matched(watchlist, [make_record('TH')]) == [(short.id, 'TH'), (any_callsign.id, 'TH')]
+    assert matched(watchlist, [make_record('', icao24='ABC123')]) == [(any_callsign.id, '')]
+
+
+def test_prefix_lengths():
+    watchlist = Watchlist()
+    short = watchlist.add_rule(callsign_prefix='THY')
+    long = watchlist.add_rule(callsign_prefix='THY12')
+
+    assert matched(watchlist, [make_record('THY123')]) == [(short.id, 'THY123'), (long.id, 'THY123')]
+    assert matched(watchlist, [make_record('THY9')]) == [(short.id, 'THY9')]
+    assert matched(watchlist, [make_record('TH')]) == []
+
+
+def test_geofence():
+    watchlist = Watchlist()
+    rule = watchlist.add_rule(geofence=(42.0, 44.0, 33.0, 35.0))
+    records = [
+        make_record('IN1'),
+        make_record('OUT1', latitude=50.0),
+        make_record('NOPOS', latitude=None, longitude=None)
+    ]
+
+    assert matched(watchlist, records) == [(rule.id, 'IN1')]
+
+
+def test_altitude_band():
+    watchlist = Watchlist()
+    rule = watchlist.add_rule(altitude_min=10000, altitude_max=20000)
+    records = [
+        make_record('LOW', altitude=5000),
+        make_record('MID', altitude=15000),
+        make_record('HIGH', altitude=35000)
+    ]
+
+    assert matched(watchlist, records) == [(rule.id, 'MID')]
+
+
+def test_remove_rule():
+    watchlist = Watchlist()
+    rule = watchlist.add_rule(airline='THY', callsign_prefix='THY')
+    other = watchlist.add_rule(airline='THY')
+
+    assert watchlist.remove_rule(rule.id)
+    assert not watchlist.remove_rule(rule.id)
+    assert matched(watchlist, [make_record('THY1')]) == [(other.id, 'THY1')]
+
+    assert watchlist.remove_rule(other.id)
+    assert watchlist._index == {}
+    assert matched(watchlist, [make_record('THY1')]) == []
+
+
+def test_events_only_when_aircraft_starts_matching():
+    watchlist = Watchlist()
+    rule = watchlist.add_rule(altitude_min=10000)
+    received = []
+    watchlist.subscribe(received.append)
+
+    climbing = make_record('THY1', altitude=30000)
+    assert matched(watchlist, [climbing]) == [(rule.id, 'THY1')]
+    assert matched(watchlist, [climbing]) == []
+    assert matched(watchlist, [make_record('THY1', altitude=5000)]) == []
+    assert matched(watchlist, [climbing]) == [(rule.id, 'THY1')]
+    assert len(received) == 2
+
+
+def test_load_rules(tmp_path):
+    path = tmp_path / "watchlist.json"
+    path.write_text(json.dumps([
+        {"airline": "THY", "aircraft_type": "B738"},
+        {"geofence": [42.0, 44.0, 33.0, 35.0], "altitude_max": 20000}
+    ]))
+    watchlist = Watchlist()
+
+    rules = watchlist.load_rules(str(path))
+
+    assert [r.airline for r in rules] == ['THY', None]
+    assert rules[1].geofence == (42.0, 44.0, 33.0, 35.0)
+    assert matched(watchlist, [make_record('THY1')]) == [(rules[0].id, 'THY1')]
+
+
+def test_unknown_rule_field_is_rejected():
+    with pytest.raises(ValueError):
+        Watchlist().add_rule(country='TR')
+
+
+@pytest.mark.parametrize('predicates', [
+    {'airline': ''},
+    {'aircraft_type': '  '},
+    {'callsign_prefix': ''},
+    {'geofence': (1.0, 2.0)}
+])
+def test_empty_or_malformed_values_are_rejected(predicates):
+    watchlist = Watchlist()
+
+    with pytest.raises(ValueError):
+        watchlist.add_rule(**predicates)
+    assert watchlist.rules == {}
+
+
+def test_load_rules_is_all_or_nothing(tmp_path):
+    path = tmp_path / "watchlist.json"
+    path.write_text(json.dumps([
+        {"airline": "THY"},
+        {"airline": "PGT", "country": "TR"}
+    ]))
+    watchlist = Watchlist()
+
+    with pytest.raises(ValueError, match="правило 2"):
+        watchlist.load_rules(str(path))
+    assert watchlist.rules == {}